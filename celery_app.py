@@ -1,5 +1,7 @@
 from celery import Celery
+from kombu import Queue
 import os
+import redis
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -7,11 +9,23 @@ load_dotenv()
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
 
+# Named queues so small interactive jobs never sit behind a full report
+INTERACTIVE_QUEUE = "interactive"
+REPORTS_QUEUE = "reports"
+INGESTION_QUEUE = "ingestion"
+TASK_QUEUES = [INTERACTIVE_QUEUE, REPORTS_QUEUE, INGESTION_QUEUE]
+
+# Max number of full reports running at once across all workers
+MAX_CONCURRENT_REPORTS = int(os.getenv("MAX_CONCURRENT_REPORTS", "2"))
+
+# Shared client for the report semaphore and queue metrics
+redis_client = redis.Redis.from_url(CELERY_BROKER_URL)
+
 celery_app = Celery(
     "store_monitoring",
     broker=CELERY_BROKER_URL,
     backend=CELERY_RESULT_BACKEND,
-    include=["report_generation"]
+    include=["report_generation", "ingest_csv", "queue_metrics", "snapshot"]
 )
 
 celery_app.conf.update(
@@ -26,4 +40,12 @@ celery_app.conf.update(
     worker_prefetch_multiplier=1,
     task_acks_late=True,
     worker_disable_rate_limits=True,
+    task_queues=[Queue(name) for name in TASK_QUEUES],
+    task_default_queue=REPORTS_QUEUE,
+    task_routes={
+        "generate_single_store_report": {"queue": INTERACTIVE_QUEUE},
+        "generate_store_report": {"queue": REPORTS_QUEUE},
+        "ingest_data": {"queue": INGESTION_QUEUE},
+        "export_snapshot": {"queue": INGESTION_QUEUE},
+    },
 )
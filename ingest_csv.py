@@ -3,8 +3,10 @@ import os
 import pandas as pd
 from sqlalchemy.exc import IntegrityError
 
+from celery_app import celery_app
 from database_models import StoreBusinessHours, StoreStatus, StoreTimezones
 from database import Session as DBSession
+from snapshot import USE_SNAPSHOT, export_snapshot
 
 logging.basicConfig(
     level=logging.INFO,
@@ -188,12 +190,32 @@ def ingest_data(data_dir="data", table="all"):
             total_ingested += count
             
         logger.info(f" Total records ingested: {total_ingested:,}")
-        return True
         
     except Exception as e:
         logger.error(f"Data ingestion failed: {e}")
         return False
     
+    # Rows are committed at this point, a failed export leaves a stale snapshot that
+    # reports detect through its data version and skip in favour of Postgres
+    if USE_SNAPSHOT:
+        try:
+            logger.info("Exporting report snapshot...")
+            version = export_snapshot()
+            logger.info(f"Snapshot {version} exported")
+        except Exception as e:
+            logger.error(f"Snapshot export failed, reports load from Postgres until it is exported again: {e}")
+    
+    return True
+
+
+@celery_app.task(name="ingest_data", time_limit=3600, soft_time_limit=3300)
+def ingest_data_task(data_dir="data", table="all"):
+    """Run CSV ingestion on the ingestion queue, away from report workers."""
+    
+    if not ingest_data(data_dir, table):
+        raise RuntimeError(f"Data ingestion failed for table '{table}' from {data_dir}")
+    return True
+    
 
 if __name__ == "__main__":
     logger.info("Starting CSV ingestion")
@@ -2,12 +2,18 @@ from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 from fastapi.responses import FileResponse, JSONResponse
+from celery.exceptions import TimeoutError as CeleryTimeoutError
 import database_models
 from database import Session, engine
 import uuid
 import os
 
-from report_generation import generate_store_report
+from report_generation import generate_store_report, generate_single_store_report
+from queue_metrics import get_queue_metrics
+
+# Seconds to wait for an interactive single store report
+STORE_REPORT_TIMEOUT = 30
+
 app = FastAPI(title="Store Monitoring System", version="1.0.0")
 database_models.Base.metadata.create_all(bind=engine)
 
@@ -26,8 +32,15 @@ def greet():
 
 @app.post("/trigger_report")
 def trigger_report():
+    db = Session()
     try:
         report_id = str(uuid.uuid4())
+        
+        # Report may wait a while for a slot, keep it visible to get_report meanwhile
+        report_record = database_models.ReportDownloads(report_name=report_id, status="Pending")
+        db.add(report_record)
+        db.commit()
+        
         generate_store_report.delay(report_id)
         
         return {
@@ -37,7 +50,37 @@ def trigger_report():
         }
         
     except Exception as e:
+        if 'report_record' in locals():
+            report_record.status = "Failed"
+            report_record.error_message = f"Error starting report generation: {str(e)}"
+            db.commit()
         raise HTTPException(status_code=500, detail=f"Error starting report generation: {str(e)}")
+    finally:
+        db.close()
+
+
+@app.get("/store_report/{store_id}")
+def store_report(store_id: str):
+    try:
+        result = generate_single_store_report.delay(store_id)
+        return result.get(timeout=STORE_REPORT_TIMEOUT)
+        
+    except CeleryTimeoutError:
+        # Nobody will collect the result, drop the task and anything it stored
+        result.revoke()
+        result.forget()
+        raise HTTPException(status_code=504, detail=f"Store report timed out after {STORE_REPORT_TIMEOUT} seconds")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating store report: {str(e)}")
+
+
+@app.get("/metrics/queues")
+def get_metrics():
+    try:
+        return get_queue_metrics()
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching queue metrics: {str(e)}")
 
 
 @app.get("/get_report/{report_id}")
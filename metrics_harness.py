@@ -0,0 +1,332 @@
+"""
+Differential harness for the uptime/downtime metrics engine.
+
+Generates random store timelines, business hours and timezones (DST days and
+overnight shifts included), runs the reference engine next to a candidate engine
+on every case and fails on any result that differs by more than the tolerance.
+
+    python metrics_harness.py --period-engine my_engine:calculate_period_metrics
+    python metrics_harness.py --save baseline.json      # before changing report_generation
+    python metrics_harness.py --compare baseline.json   # after changing it
+
+Stored timestamps are naive and astimezone() reads them in the process local
+timezone. Run from the command line the harness uses UTC unless TZ is set,
+e.g. TZ=America/New_York, to check the engine on a non-UTC worker host.
+"""
+import argparse
+import importlib
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, time as dt_time
+from functools import lru_cache
+import pandas as pd
+import pytz
+
+from report_generation import (
+    DEFAULT_BUSINESS_HOURS,
+    calculate_business_hours_duration,
+    calculate_period_metrics,
+)
+from snapshot import StatusRecord
+
+TIMEZONES = [
+    "America/Chicago",
+    "America/New_York",
+    "America/Denver",
+    "America/Los_Angeles",
+    "America/Phoenix",
+    "Europe/London",
+    "Australia/Sydney",
+    "Australia/Lord_Howe",  # 30 minute DST shift
+    "Asia/Kolkata",
+    "UTC",
+]
+
+PERIODS = [timedelta(hours=1), timedelta(days=1), timedelta(weeks=1)]
+
+# Report end times are drawn from this range, same era as the store status data
+DATE_RANGE = (datetime(2022, 1, 1), datetime(2024, 12, 31))
+
+
+def load_engine(spec: str):
+    """
+    Load an engine function from a "module:function" string
+    """
+    module_name, _, func_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+@lru_cache(maxsize=None)
+def dst_change_days(timezone_str: str) -> list:
+    """
+    Noon UTC of every day in DATE_RANGE after which the zone's UTC offset changes
+    """
+    tz = pytz.timezone(timezone_str)
+    days = []
+    day = DATE_RANGE[0].replace(hour=12, tzinfo=pytz.utc)
+    offset = day.astimezone(tz).utcoffset()
+    while day.replace(tzinfo=None) < DATE_RANGE[1]:
+        next_day = day + timedelta(days=1)
+        next_offset = next_day.astimezone(tz).utcoffset()
+        if next_offset != offset:
+            days.append(day.replace(tzinfo=None))
+        day, offset = next_day, next_offset
+    return days
+
+
+def random_end_time(rng: random.Random, timezone_str: str) -> datetime:
+    """
+    Pick a naive UTC report end time, about half of them within a few days of a DST change
+    """
+    transitions = dst_change_days(timezone_str)
+    if transitions and rng.random() < 0.5:
+        base = rng.choice(transitions)
+        return base + timedelta(minutes=rng.randint(-3 * 24 * 60, 3 * 24 * 60))
+
+    span = int((DATE_RANGE[1] - DATE_RANGE[0]).total_seconds())
+    return DATE_RANGE[0] + timedelta(seconds=rng.randint(0, span))
+
+
+def random_time(rng: random.Random) -> dt_time:
+    return dt_time(rng.randint(0, 23), rng.choice([0, 0, 15, 30, 45, rng.randint(0, 59)]), rng.choice([0, 0, rng.randint(0, 59)]))
+
+
+def random_business_hours(rng: random.Random) -> dict:
+    """
+    Generate business hours: 24/7, closed, normal, overnight, equal open/close and missing days
+    """
+    mode = rng.choice(["default", "empty", "normal", "overnight", "mixed", "mixed"])
+
+    if mode == "default":
+        return {day: DEFAULT_BUSINESS_HOURS for day in range(7)}
+    if mode == "empty":
+        return {}
+
+    business_hours = {}
+    for day in range(7):
+        if mode == "mixed" and rng.random() < 0.2:
+            continue  # closed that day
+
+        open_time, close_time = random_time(rng), random_time(rng)
+        if mode == "normal" and open_time > close_time:
+            open_time, close_time = close_time, open_time
+        elif mode == "overnight" and open_time < close_time:
+            open_time, close_time = close_time, open_time
+        elif mode == "mixed" and rng.random() < 0.1:
+            close_time = open_time
+
+        business_hours[day] = (open_time, close_time)
+    return business_hours
+
+
+def random_timeline(rng: random.Random, report_end_time: datetime) -> list:
+    """
+    Generate a sorted status timeline covering a bit more than the longest period
+    """
+    count = rng.choice([0, 1, 2, rng.randint(3, 20), rng.randint(20, 250)])
+    window_start = report_end_time - PERIODS[-1] - timedelta(days=1)
+    span = int((report_end_time - window_start).total_seconds())
+
+    timestamps = [window_start + timedelta(seconds=rng.randint(0, span)) for _ in range(count)]
+
+    # Records landing exactly on a period boundary are a common off-by-one source
+    for period in PERIODS:
+        if rng.random() < 0.15:
+            timestamps.append(report_end_time - period)
+    if rng.random() < 0.1:
+        timestamps.append(report_end_time)
+    if rng.random() < 0.05:
+        timestamps.append(report_end_time + timedelta(minutes=rng.randint(1, 30)))
+
+    records = []
+    status = rng.choice(["active", "inactive"])
+    for timestamp in sorted(timestamps):
+        if rng.random() < 0.3:
+            status = "inactive" if status == "active" else "active"
+        records.append(StatusRecord(timestamp, status))
+
+    # Duplicate timestamps happen in the real data
+    if records and rng.random() < 0.05:
+        records.append(rng.choice(records))
+        records.sort(key=lambda record: record.store_status_data)
+
+    return records
+
+
+def generate_cases(seed: int, count: int) -> list:
+    rng = random.Random(seed)
+    cases = []
+    for case_id in range(count):
+        timezone_str = rng.choice(TIMEZONES)
+        report_end_time = random_end_time(rng, timezone_str).replace(second=0, microsecond=0)
+
+        duration_start = report_end_time - timedelta(minutes=rng.randint(-60, 9 * 24 * 60))
+        cases.append({
+            "case_id": case_id,
+            "timezone": timezone_str,
+            "report_end_time": report_end_time,
+            "business_hours": random_business_hours(rng),
+            "records": random_timeline(rng, report_end_time),
+            "duration_range": (duration_start, report_end_time),
+        })
+    return cases
+
+
+def run_case(case: dict, period_engine, duration_engine) -> tuple:
+    """
+    Run one case through both engine functions, returns the results and the elapsed seconds
+    """
+    tz = pytz.timezone(case["timezone"])
+    end = case["report_end_time"]
+
+    start_time = time.perf_counter()
+    results = [
+        period_engine(case["records"], end - period, end, tz, case["business_hours"])
+        for period in PERIODS
+    ]
+    results.append((duration_engine(*case["duration_range"], tz, case["business_hours"]),))
+    elapsed = time.perf_counter() - start_time
+
+    return [list(result) for result in results], elapsed
+
+
+def diff_results(expected: list, actual: list) -> float:
+    """
+    Largest absolute difference in minutes between two result sets, infinite if their shapes differ
+    """
+    if len(expected) != len(actual):
+        return float("inf")
+
+    difference = 0.0
+    for expected_result, actual_result in zip(expected, actual):
+        if len(expected_result) != len(actual_result):
+            return float("inf")
+        for e, a in zip(expected_result, actual_result):
+            difference = max(difference, abs(e - a))
+    return difference
+
+
+def describe_case(case: dict) -> str:
+    hours = {day: f"{o}-{c}" for day, (o, c) in case["business_hours"].items()}
+    return (
+        f"case {case['case_id']}: tz={case['timezone']} end={case['report_end_time']} "
+        f"records={len(case['records'])} hours={hours} duration_range={case['duration_range']}"
+    )
+
+
+def local_timezone() -> str:
+    """
+    Process local timezone, astimezone() reads the naive stored timestamps in it
+    """
+    return os.environ.get("TZ") or "/".join(time.tzname)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Differential correctness and timing harness for the metrics engine")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cases", type=int, default=500)
+    parser.add_argument("--tolerance", type=float, default=1e-6, help="Allowed difference in minutes")
+    parser.add_argument("--period-engine", help="Candidate calculate_period_metrics as module:function")
+    parser.add_argument("--duration-engine", help="Candidate calculate_business_hours_duration as module:function")
+    parser.add_argument("--save", help="Write reference results to this JSON file")
+    parser.add_argument("--compare", help="Compare reference results against a JSON file written by --save")
+    parser.add_argument("--timings", help="Write per-case timings to this CSV file")
+    args = parser.parse_args(argv)
+
+    if not (args.period_engine or args.duration_engine or args.compare or args.save):
+        parser.error("nothing to compare, pass --period-engine, --duration-engine, --compare or --save")
+
+    candidate_period = load_engine(args.period_engine) if args.period_engine else None
+    candidate_duration = load_engine(args.duration_engine) if args.duration_engine else None
+    has_candidate = candidate_period is not None or candidate_duration is not None
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["seed"] != args.seed or len(baseline["results"]) != args.cases:
+            print(f"Baseline was recorded with seed={baseline['seed']} cases={len(baseline['results'])}")
+            return 2
+        if baseline["local_timezone"] != local_timezone():
+            print(f"Baseline was recorded with local timezone {baseline['local_timezone']}, this run uses {local_timezone()}")
+            return 2
+
+    cases = generate_cases(args.seed, args.cases)
+    print(f"Generated {len(cases)} cases with seed {args.seed}, local timezone {local_timezone()}")
+
+    timings = []
+    reference_results = []
+    mismatched_cases = set()
+
+    for case in cases:
+        expected, reference_seconds = run_case(case, calculate_period_metrics, calculate_business_hours_duration)
+        reference_results.append(expected)
+        timing = {"case_id": case["case_id"], "timezone": case["timezone"], "records": len(case["records"]), "reference_seconds": reference_seconds}
+
+        if has_candidate:
+            try:
+                actual, candidate_seconds = run_case(
+                    case,
+                    candidate_period or calculate_period_metrics,
+                    candidate_duration or calculate_business_hours_duration,
+                )
+                difference = diff_results(expected, actual)
+            except Exception as e:
+                # A crashing or malformed engine is a mismatch, keep going so every bad case is reported
+                mismatched_cases.add(case["case_id"])
+                print(f"ERROR {describe_case(case)}\n  expected={expected}\n  error={e!r}")
+                timings.append(timing)
+                continue
+
+            timing["candidate_seconds"] = candidate_seconds
+            if difference > args.tolerance:
+                mismatched_cases.add(case["case_id"])
+                print(f"MISMATCH {describe_case(case)}\n  expected={expected}\n  actual={actual}")
+
+        if baseline is not None:
+            difference = diff_results(baseline["results"][case["case_id"]], expected)
+            if difference > args.tolerance:
+                mismatched_cases.add(case["case_id"])
+                print(f"MISMATCH vs baseline {describe_case(case)}\n  baseline={baseline['results'][case['case_id']]}\n  current={expected}")
+
+        timings.append(timing)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"seed": args.seed, "local_timezone": local_timezone(), "results": reference_results}, f)
+        print(f"Reference results saved to: {args.save}")
+
+    timings_df = pd.DataFrame(timings)
+    if args.timings:
+        timings_df.to_csv(args.timings, index=False)
+        print(f"Per-case timings saved to: {args.timings}")
+
+    for column in ["reference_seconds", "candidate_seconds"]:
+        if column in timings_df:
+            values = timings_df[column].dropna().tolist()
+            if not values:
+                continue
+            p95 = statistics.quantiles(values, n=20)[-1] if len(values) > 1 else values[0]
+            print(f"{column}: total={sum(values):.4f} mean={statistics.mean(values) * 1000:.3f}ms p95={p95 * 1000:.3f}ms")
+    if "candidate_seconds" in timings_df:
+        timed = timings_df.dropna(subset=["candidate_seconds"])
+        if len(timed):
+            print(f"Speedup: {timed['reference_seconds'].sum() / timed['candidate_seconds'].sum():.2f}x")
+
+    if not has_candidate and baseline is None:
+        print("No comparison made, only reference results were recorded")
+        return 0
+
+    print(f"{len(cases) - len(mismatched_cases)}/{len(cases)} cases matched")
+    return 1 if mismatched_cases else 0
+
+
+if __name__ == "__main__":
+    # Workers usually run with UTC local time, set TZ to check how the engine behaves elsewhere
+    os.environ.setdefault("TZ", "UTC")
+    time.tzset()
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import time
+from celery.signals import before_task_publish, task_prerun
+from celery_app import redis_client, TASK_QUEUES, REPORTS_QUEUE, MAX_CONCURRENT_REPORTS
+from task_limits import report_semaphore
+
+WAIT_TIMES_KEY = "queue_metrics:wait_times:{queue}"
+
+# Number of recent wait times kept per queue for percentiles
+WAIT_SAMPLES = 1000
+
+
+@before_task_publish.connect
+def stamp_enqueue_time(headers=None, **kwargs):
+    """
+    Record when the task was first published so the worker can measure queue wait time,
+    retries carry the original value
+    """
+    if headers is not None:
+        headers.setdefault("enqueued_at", time.time())
+
+
+# Tasks that record their own wait time once they actually start work
+SELF_TIMED_TASKS = {"generate_store_report"}
+
+
+@task_prerun.connect
+def record_prerun_wait_time(task=None, **kwargs):
+    """
+    Store how long the task waited in its queue before a worker picked it up
+    """
+    if task.name in SELF_TIMED_TASKS:
+        return
+
+    delivery_info = task.request.delivery_info or {}
+    record_wait_time(delivery_info.get("routing_key"), getattr(task.request, "enqueued_at", None))
+
+
+def record_wait_time(queue, enqueued_at):
+    """
+    Store one wait time sample, from first publish until the task starts work
+    """
+    if enqueued_at is None or queue not in TASK_QUEUES:
+        return
+
+    wait_seconds = max(time.time() - float(enqueued_at), 0.0)
+    key = WAIT_TIMES_KEY.format(queue=queue)
+    pipe = redis_client.pipeline()
+    pipe.lpush(key, wait_seconds)
+    pipe.ltrim(key, 0, WAIT_SAMPLES - 1)
+    pipe.execute()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(pct / 100.0 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def get_queue_metrics() -> dict:
+    """
+    Get queue depth and recent wait time stats for every named queue
+    """
+    queues = {}
+    for queue in TASK_QUEUES:
+        # The Redis broker keeps pending messages in a list named after the queue
+        depth = redis_client.llen(queue)
+        wait_times = sorted(float(v) for v in redis_client.lrange(WAIT_TIMES_KEY.format(queue=queue), 0, -1))
+
+        queues[queue] = {
+            "depth": depth,
+            "wait_samples": len(wait_times),
+            "wait_avg_seconds": round(sum(wait_times) / len(wait_times), 3) if wait_times else 0.0,
+            "wait_p50_seconds": round(percentile(wait_times, 50), 3),
+            "wait_p95_seconds": round(percentile(wait_times, 95), 3),
+            "wait_max_seconds": round(wait_times[-1], 3) if wait_times else 0.0,
+        }
+
+    # Reports retried while waiting for a slot sit in worker memory as ETA messages, not in the queue
+    queues[REPORTS_QUEUE]["waiting_for_slot"] = report_semaphore.waiting()
+
+    return {
+        "queues": queues,
+        "running_reports": report_semaphore.in_use(),
+        "max_concurrent_reports": MAX_CONCURRENT_REPORTS,
+    }
@@ -9,16 +9,37 @@ from collections import defaultdict
 from celery_app import celery_app
 from database import Session as DBSession
 from database_models import StoreStatus, StoreBusinessHours, StoreTimezones, ReportDownloads
+from task_limits import report_semaphore
+from queue_metrics import record_wait_time
+from snapshot import USE_SNAPSHOT, data_version, load_snapshot
 
 DEFAULT_TIMEZONE = 'America/Chicago'
 DEFAULT_BUSINESS_HOURS = (dt_time(0, 0, 0), dt_time(23, 59, 59))
 
+# Seconds to wait before retrying a full report when all report slots are taken
+REPORT_RETRY_COUNTDOWN = 15
+
 @celery_app.task(bind=True, name="generate_store_report")
 def generate_store_report(self, report_id: str):
-    db = DBSession()
+    # Limit concurrent full reports so they can't exhaust Postgres connections
+    enqueued_at = getattr(self.request, "enqueued_at", None)
+    semaphore_token = report_semaphore.acquire()
+    if semaphore_token is None:
+        print(f"All report slots in use, retrying {report_id} in {REPORT_RETRY_COUNTDOWN} seconds")
+        report_semaphore.mark_waiting(report_id)
+        headers = {"enqueued_at": enqueued_at} if enqueued_at is not None else None
+        raise self.retry(countdown=REPORT_RETRY_COUNTDOWN, max_retries=None, headers=headers)
+
+    db = None
     start_time = time.time()
     
     try:
+        # Slot is held from here on, anything that can fail must sit inside the try
+        report_semaphore.clear_waiting(report_id)
+        delivery_info = self.request.delivery_info or {}
+        record_wait_time(delivery_info.get("routing_key"), enqueued_at)
+
+        db = DBSession()
         report_record = db.query(ReportDownloads).filter(ReportDownloads.report_name == report_id).first()
         if not report_record:
             report_record = ReportDownloads(report_name=report_id, status="Running")
@@ -27,43 +48,29 @@ def generate_store_report(self, report_id: str):
             report_record.status = "Running"
         db.commit()
         
-        # Get latest timestamp from store status table
-        latest_timestamp = db.query(func.max(StoreStatus.store_status_data)).scalar()
+        # Map the shared snapshot when enabled and current, otherwise load everything from Postgres
+        snapshot = load_current_snapshot(db)
+        if snapshot is not None:
+            print(f"Using snapshot {snapshot.version}")
+            latest_timestamp = snapshot.latest_timestamp
+            store_ids = snapshot.store_ids
+            timezone_data = snapshot.timezone_data()
+            business_hours_data = snapshot.business_hours_data()
+            status_records_by_store = snapshot.status_records_by_store
+            status_record_count = snapshot.status_record_count
+        else:
+            latest_timestamp, store_ids, timezone_data, business_hours_data, status_records_by_store, status_record_count = load_report_data(db)
+
         print(f"Latest Timestamp: {latest_timestamp}")
-        
         report_end_time = latest_timestamp.replace(second=0, microsecond=0) + timedelta(minutes=1)
-        
-        # Get all stores Ids
-        query = db.query(StoreStatus.store_id).distinct().all()
-        store_ids = [row[0] for row in query]
-        total_stores = len(store_ids)
 
+        total_stores = len(store_ids)
         print(f"Total Number Of Stores Found: {total_stores}")
         
-        # Fetch timezones data at once
-        rows = db.query(StoreTimezones).filter(StoreTimezones.store_id.in_(store_ids)).all()
-        timezone_data = {row.store_id: row.timezone_str for row in rows}
-
-        business_hours_data = defaultdict(dict)
-        for row in db.query(StoreBusinessHours).filter(StoreBusinessHours.store_id.in_(store_ids)).all():
-            business_hours_data[row.store_id][row.dayOfWeek] = (row.start_time_local, row.end_time_local)
-        
-        # Fetch status records at once
-        status_records = db.query(StoreStatus).filter(StoreStatus.store_id.in_(store_ids)).order_by(StoreStatus.store_id, StoreStatus.store_status_data).all()
-        
-        status_records_by_store = defaultdict(list)
-        for record in status_records:
-            status_records_by_store[record.store_id].append(record)
-        
         # cache timezone objects
-        timezone_cache = {}
-        for timezone_str in set(timezone_data.values()):
-            try:
-                timezone_cache[timezone_str] = pytz.timezone(timezone_str)
-            except pytz.UnknownTimeZoneError:
-                timezone_cache[timezone_str] = pytz.timezone(DEFAULT_TIMEZONE)
+        timezone_cache = build_timezone_cache(timezone_data.values())
         
-        print(f"Data loaded - Stores: {len(store_ids)}, Timezones: {len(timezone_data)}, Business Hours: {len(business_hours_data)}, Status Records: {len(status_records)}, Timezone Objects: {len(timezone_cache)}")
+        print(f"Data loaded - Stores: {len(store_ids)}, Timezones: {len(timezone_data)}, Business Hours: {len(business_hours_data)}, Status Records: {status_record_count}, Timezone Objects: {len(timezone_cache)}")
 
         report_data = []
         successful_stores = 0
@@ -137,10 +144,113 @@ def generate_store_report(self, report_id: str):
         
         self.update_state(state='FAILURE', meta={'current': 0, 'total': 100, 'status': error_msg, 'execution_time': execution_time})
         raise e
+    finally:
+        if db is not None:
+            db.close()
+        report_semaphore.release(semaphore_token)
+
+
+@celery_app.task(bind=True, name="generate_single_store_report")
+def generate_single_store_report(self, store_id: str):
+    """
+    Get uptime/downtime metrics for a single store, runs on the interactive queue
+    """
+    db = DBSession()
+
+    try:
+        snapshot = load_current_snapshot(db)
+        if snapshot is not None and store_id in snapshot.store_index:
+            report_end_time = snapshot.latest_timestamp.replace(second=0, microsecond=0) + timedelta(minutes=1)
+            timezone_data = snapshot.timezone_data([store_id])
+            timezone_cache = build_timezone_cache(timezone_data.values())
+            return get_stores_status_data(db, store_id, report_end_time, timezone_data, snapshot.business_hours_data([store_id]), snapshot.status_records_by_store, timezone_cache)
+
+        latest_timestamp = db.query(func.max(StoreStatus.store_status_data)).scalar()
+        if latest_timestamp is None:
+            raise ValueError("No store status data found, run ingestion first")
+        report_end_time = latest_timestamp.replace(second=0, microsecond=0) + timedelta(minutes=1)
+
+        timezone_row = db.query(StoreTimezones).filter(StoreTimezones.store_id == store_id).first()
+        timezone_data = {store_id: timezone_row.timezone_str} if timezone_row else {}
+
+        business_hours_data = defaultdict(dict)
+        for row in db.query(StoreBusinessHours).filter(StoreBusinessHours.store_id == store_id).all():
+            business_hours_data[row.store_id][row.dayOfWeek] = (row.start_time_local, row.end_time_local)
+
+        status_records = db.query(StoreStatus).filter(StoreStatus.store_id == store_id).order_by(StoreStatus.store_status_data).all()
+
+        timezone_cache = build_timezone_cache(timezone_data.values())
+
+        return get_stores_status_data(db, store_id, report_end_time, timezone_data, business_hours_data, {store_id: status_records}, timezone_cache)
     finally:
         db.close()
 
 
+def load_current_snapshot(db: Session):
+    """
+    Map the snapshot when enabled, but only if it was built from the data currently in Postgres
+    """
+    if not USE_SNAPSHOT:
+        return None
+
+    try:
+        snapshot = load_snapshot()
+    except (OSError, EOFError, ValueError, KeyError) as e:
+        print(f"Could not load snapshot ({e}), loading from Postgres")
+        return None
+    if snapshot is None:
+        return None
+
+    current_version = data_version(db)
+    if snapshot.data_version != current_version:
+        print(f"Snapshot {snapshot.version} is stale (snapshot {snapshot.data_version}, database {current_version}), loading from Postgres")
+        return None
+
+    return snapshot
+
+
+def load_report_data(db: Session):
+    """
+    Load every input the full report needs from Postgres
+    """
+    # Get latest timestamp from store status table
+    latest_timestamp = db.query(func.max(StoreStatus.store_status_data)).scalar()
+
+    # Get all stores Ids
+    query = db.query(StoreStatus.store_id).distinct().all()
+    store_ids = [row[0] for row in query]
+
+    # Fetch timezones data at once
+    rows = db.query(StoreTimezones).filter(StoreTimezones.store_id.in_(store_ids)).all()
+    timezone_data = {row.store_id: row.timezone_str for row in rows}
+
+    business_hours_data = defaultdict(dict)
+    for row in db.query(StoreBusinessHours).filter(StoreBusinessHours.store_id.in_(store_ids)).all():
+        business_hours_data[row.store_id][row.dayOfWeek] = (row.start_time_local, row.end_time_local)
+
+    # Fetch status records at once
+    status_records = db.query(StoreStatus).filter(StoreStatus.store_id.in_(store_ids)).order_by(StoreStatus.store_id, StoreStatus.store_status_data).all()
+
+    status_records_by_store = defaultdict(list)
+    for record in status_records:
+        status_records_by_store[record.store_id].append(record)
+
+    return latest_timestamp, store_ids, timezone_data, business_hours_data, status_records_by_store, len(status_records)
+
+
+def build_timezone_cache(timezone_strs) -> dict:
+    """
+    Build pytz timezone objects once per distinct timezone string
+    """
+    timezone_cache = {}
+    for timezone_str in set(timezone_strs):
+        try:
+            timezone_cache[timezone_str] = pytz.timezone(timezone_str)
+        except pytz.UnknownTimeZoneError:
+            timezone_cache[timezone_str] = pytz.timezone(DEFAULT_TIMEZONE)
+    return timezone_cache
+
+
 def get_stores_status_data(db: Session, store_id: str, report_end_time: datetime, timezone_data: dict, business_hours_data: dict, status_records_by_store: dict, timezone_cache: dict) -> dict:
     """
    Get store online/offline status data
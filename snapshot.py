@@ -0,0 +1,256 @@
+import json
+import os
+import shutil
+import time
+from collections import defaultdict, namedtuple
+from collections.abc import Mapping
+from datetime import datetime, timedelta, time as dt_time
+import numpy as np
+from sqlalchemy import func
+from celery_app import celery_app
+from database import Session as DBSession
+from database_models import StoreStatus, StoreBusinessHours, StoreTimezones
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+USE_SNAPSHOT = os.getenv("USE_SNAPSHOT", "false").lower() in ("1", "true", "yes")
+
+# File inside SNAPSHOT_DIR holding the name of the latest complete snapshot
+CURRENT_FILE = "CURRENT"
+
+# Status history kept in the snapshot, matches the longest report period
+SNAPSHOT_HISTORY = timedelta(weeks=1)
+
+HOURS_DTYPE = np.dtype([("store_idx", "i4"), ("day", "i1"), ("start", "i4"), ("end", "i4")])
+
+# Same attribute names as StoreStatus so the metrics code works on either
+StatusRecord = namedtuple("StatusRecord", ["store_status_data", "status"])
+
+# Snapshot mapped by this worker process, reused until a newer version shows up
+_loaded_snapshot = None
+
+
+def time_to_seconds(value: dt_time) -> int:
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def seconds_to_time(value: int) -> dt_time:
+    return dt_time(value // 3600, (value % 3600) // 60, value % 60)
+
+
+def data_version(db) -> dict:
+    """
+    Row count and max id of every table the snapshot is built from, changes on any ingestion
+    """
+    version = {}
+    for model in (StoreStatus, StoreBusinessHours, StoreTimezones):
+        count, max_id = db.query(func.count(model.id), func.max(model.id)).one()
+        version[model.__tablename__] = [count, max_id]
+    return version
+
+
+@celery_app.task(name="export_snapshot")
+def export_snapshot_task():
+    return export_snapshot()
+
+
+def export_snapshot(snapshot_dir: str = SNAPSHOT_DIR) -> str:
+    """
+    Export timezones, business hours and recent status timelines to a versioned
+    directory of .npy files that workers can memory-map
+    """
+    db = DBSession()
+    start_time = time.time()
+
+    try:
+        # Read before the data so rows ingested mid-export make the snapshot look stale, not current
+        source_version = data_version(db)
+
+        latest_timestamp = db.query(func.max(StoreStatus.store_status_data)).scalar()
+        if latest_timestamp is None:
+            raise ValueError("No store status data to snapshot")
+
+        report_end_time = latest_timestamp.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        history_start = report_end_time - SNAPSHOT_HISTORY
+
+        # Records in the history window, plus the last one before it for each store,
+        # which is all the metrics need to fill the gap at the period start
+        window_rows = db.query(
+            StoreStatus.store_id, StoreStatus.store_status_data, StoreStatus.status
+        ).filter(StoreStatus.store_status_data >= history_start).order_by(StoreStatus.store_id, StoreStatus.store_status_data).all()
+
+        previous_rows = db.query(
+            StoreStatus.store_id, StoreStatus.store_status_data, StoreStatus.status
+        ).filter(StoreStatus.store_status_data < history_start).distinct(StoreStatus.store_id).order_by(
+            StoreStatus.store_id, StoreStatus.store_status_data.desc()
+        ).all()
+
+        rows_by_store = defaultdict(list)
+        for row in previous_rows:
+            rows_by_store[row[0]].append(row)
+        for row in window_rows:
+            rows_by_store[row[0]].append(row)
+
+        store_ids = sorted(rows_by_store)
+        timestamps = []
+        active = []
+        offsets = [0]
+        for store_id in store_ids:
+            timestamps.extend(row[1] for row in rows_by_store[store_id])
+            active.extend(row[2] == "active" for row in rows_by_store[store_id])
+            offsets.append(len(timestamps))
+
+        store_index = {store_id: i for i, store_id in enumerate(store_ids)}
+
+        timezones = [""] * len(store_ids)
+        for row in db.query(StoreTimezones).filter(StoreTimezones.store_id.in_(store_ids)).all():
+            timezones[store_index[row.store_id]] = row.timezone_str
+
+        hours = [
+            (store_index[row.store_id], int(row.dayOfWeek), time_to_seconds(row.start_time_local), time_to_seconds(row.end_time_local))
+            for row in db.query(StoreBusinessHours).filter(StoreBusinessHours.store_id.in_(store_ids)).all()
+        ]
+    finally:
+        db.close()
+
+    version = time.strftime("%Y%m%dT%H%M%S", time.gmtime()) + f"-{os.getpid()}"
+    version_dir = os.path.join(snapshot_dir, version)
+    tmp_dir = version_dir + ".tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    np.save(os.path.join(tmp_dir, "store_ids.npy"), np.array(store_ids, dtype=str))
+    np.save(os.path.join(tmp_dir, "timezones.npy"), np.array(timezones, dtype=str))
+    np.save(os.path.join(tmp_dir, "hours.npy"), np.array(hours, dtype=HOURS_DTYPE))
+    np.save(os.path.join(tmp_dir, "status_ts.npy"), np.array(timestamps, dtype="datetime64[us]"))
+    np.save(os.path.join(tmp_dir, "status_active.npy"), np.array(active, dtype=bool))
+    np.save(os.path.join(tmp_dir, "status_offsets.npy"), np.array(offsets, dtype=np.int64))
+
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump({
+            "version": version,
+            "latest_timestamp": latest_timestamp.isoformat(),
+            "data_version": source_version,
+            "stores": len(store_ids),
+            "status_records": len(timestamps),
+        }, f)
+
+    # Publish the snapshot only once every file is written
+    os.rename(tmp_dir, version_dir)
+    current_tmp = os.path.join(snapshot_dir, CURRENT_FILE + ".tmp")
+    with open(current_tmp, "w") as f:
+        f.write(version)
+    os.replace(current_tmp, os.path.join(snapshot_dir, CURRENT_FILE))
+
+    remove_old_snapshots(snapshot_dir, keep=version)
+
+    print(f"Snapshot {version} exported - Stores: {len(store_ids)}, Status Records: {len(timestamps)}, Business Hours: {len(hours)} in {time.time() - start_time:.2f} seconds")
+    return version
+
+
+def remove_old_snapshots(snapshot_dir: str, keep: str, keep_count: int = 2):
+    """
+    Delete all but the newest snapshots, workers still mapping an old one keep their pages
+    """
+    versions = sorted(
+        name for name in os.listdir(snapshot_dir)
+        if os.path.isdir(os.path.join(snapshot_dir, name)) and not name.endswith(".tmp")
+    )
+    for name in versions[:-keep_count]:
+        if name != keep:
+            shutil.rmtree(os.path.join(snapshot_dir, name), ignore_errors=True)
+
+
+class StatusTimelines(Mapping):
+    """
+    Read-only store_id -> status records view over the mapped status arrays
+    """
+
+    def __init__(self, store_index: dict, timestamps, active, offsets):
+        self.store_index = store_index
+        self.timestamps = timestamps
+        self.active = active
+        self.offsets = offsets
+
+    def __getitem__(self, store_id):
+        i = self.store_index[store_id]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return [
+            StatusRecord(timestamp, "active" if is_active else "inactive")
+            for timestamp, is_active in zip(self.timestamps[start:end].tolist(), self.active[start:end].tolist())
+        ]
+
+    def __iter__(self):
+        return iter(self.store_index)
+
+    def __len__(self):
+        return len(self.store_index)
+
+
+class Snapshot:
+    """
+    Memory-mapped report inputs, pages are shared by every worker on the host
+    """
+
+    def __init__(self, version_dir: str):
+        with open(os.path.join(version_dir, "meta.json")) as f:
+            meta = json.load(f)
+
+        self.version = meta["version"]
+        self.latest_timestamp = datetime.fromisoformat(meta["latest_timestamp"])
+        self.data_version = meta["data_version"]
+
+        def load(name):
+            try:
+                return np.load(os.path.join(version_dir, name), mmap_mode="r")
+            except ValueError:
+                # Empty arrays can't be memory-mapped, they are tiny so read them normally
+                return np.load(os.path.join(version_dir, name))
+
+        self.store_ids = load("store_ids.npy").tolist()
+        self.timezones = load("timezones.npy")
+        self.hours = load("hours.npy")
+
+        self.store_index = {store_id: i for i, store_id in enumerate(self.store_ids)}
+        offsets = load("status_offsets.npy")
+        self.status_record_count = int(offsets[-1])
+        self.status_records_by_store = StatusTimelines(
+            self.store_index, load("status_ts.npy"), load("status_active.npy"), offsets
+        )
+
+    def timezone_data(self, store_ids=None) -> dict:
+        store_ids = self.store_ids if store_ids is None else store_ids
+        timezone_data = {}
+        for store_id in store_ids:
+            i = self.store_index.get(store_id)
+            if i is not None and self.timezones[i]:
+                timezone_data[store_id] = str(self.timezones[i])
+        return timezone_data
+
+    def business_hours_data(self, store_ids=None) -> dict:
+        hours = self.hours
+        if store_ids is not None:
+            # Select the wanted stores' rows in NumPy so single store lookups skip everyone else
+            wanted = [self.store_index[s] for s in store_ids if s in self.store_index]
+            hours = hours[np.isin(hours["store_idx"], wanted)]
+
+        business_hours_data = defaultdict(dict)
+        for store_idx, day, start, end in hours.tolist():
+            business_hours_data[self.store_ids[store_idx]][day] = (seconds_to_time(start), seconds_to_time(end))
+        return business_hours_data
+
+
+def load_snapshot(snapshot_dir: str = SNAPSHOT_DIR):
+    """
+    Map the current snapshot, returns None if no snapshot has been exported yet
+    """
+    global _loaded_snapshot
+
+    try:
+        with open(os.path.join(snapshot_dir, CURRENT_FILE)) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+
+    if _loaded_snapshot is None or _loaded_snapshot.version != version:
+        _loaded_snapshot = Snapshot(os.path.join(snapshot_dir, version))
+
+    return _loaded_snapshot
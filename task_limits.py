@@ -0,0 +1,64 @@
+import time
+import uuid
+from celery_app import celery_app, redis_client, MAX_CONCURRENT_REPORTS
+
+REPORT_SEMAPHORE_KEY = "semaphore:generate_store_report"
+
+# Slot lifetime, a little over the task hard time limit so crashed workers free their slot
+SEMAPHORE_TIMEOUT = celery_app.conf.task_time_limit + 30
+
+# Waiting entries are refreshed on every retry, drop ones not seen for this long
+WAITING_TIMEOUT = 60
+
+# Drop expired holders, then take a slot only if one is free (atomic on the Redis server)
+ACQUIRE_SCRIPT = redis_client.register_script("""
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', tonumber(ARGV[1]) - tonumber(ARGV[2]))
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[1], ARGV[1], ARGV[4])
+    return 1
+end
+return 0
+""")
+
+
+class RedisSemaphore:
+    """
+    Distributed counting semaphore shared by all workers through Redis
+    """
+
+    def __init__(self, key: str, limit: int, timeout: int = SEMAPHORE_TIMEOUT):
+        self.key = key
+        self.waiting_key = f"{key}:waiting"
+        self.limit = limit
+        self.timeout = timeout
+
+    def acquire(self):
+        """
+        Try to take a slot, returns a token on success or None if all slots are in use
+        """
+        token = str(uuid.uuid4())
+        acquired = ACQUIRE_SCRIPT(keys=[self.key], args=[time.time(), self.timeout, self.limit, token])
+        return token if acquired else None
+
+    def release(self, token: str):
+        redis_client.zrem(self.key, token)
+
+    def in_use(self) -> int:
+        redis_client.zremrangebyscore(self.key, "-inf", time.time() - self.timeout)
+        return redis_client.zcard(self.key)
+
+    def mark_waiting(self, member: str):
+        """
+        Track a task that could not get a slot, retried tasks are invisible in the queue length
+        """
+        redis_client.zadd(self.waiting_key, {member: time.time()})
+
+    def clear_waiting(self, member: str):
+        redis_client.zrem(self.waiting_key, member)
+
+    def waiting(self) -> int:
+        redis_client.zremrangebyscore(self.waiting_key, "-inf", time.time() - WAITING_TIMEOUT)
+        return redis_client.zcard(self.waiting_key)
+
+
+report_semaphore = RedisSemaphore(REPORT_SEMAPHORE_KEY, MAX_CONCURRENT_REPORTS)